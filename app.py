@@ -2,8 +2,10 @@ import streamlit as st
 from google.cloud import bigquery
 from google.oauth2 import service_account
 import polars as pl
-import math
+import hashlib
+import os
 from datetime import date
+from pathlib import Path
 import json
 
 # --- CONFIG ---
@@ -11,71 +13,229 @@ PROJECT_ID = "course-data-engineering"
 DATASET = "igdb_dwh"
 TABLE = "games_dashboard"
 ROWS_PER_PAGE = 20
+CACHE_DIR = Path("/tmp")
+# BigQuery exports int64/float64; these ranges fit much narrower types
+NARROW_DTYPES = {"rating": pl.Float32, "rating_count": pl.UInt32, "hypes": pl.UInt16}
+UPCOMING_SORT_COLUMNS = {"Hypes": "hypes", "Release Date": "first_release_date"}
 
 # --- AUTHENTICATION ---
 credentials_dict = st.secrets["streamlit-sa"]
 credentials = service_account.Credentials.from_service_account_info(credentials_dict)
 client = bigquery.Client(credentials=credentials, project=PROJECT_ID)
 
-# --- CACHE FULL DATASET ONCE A DAY ---
-@st.cache_data(show_spinner="Loading and caching full dataset...", ttl=86400)
-def load_full_dataset():
+# --- CACHE DATASETS ONCE A DAY ---
+def run_query(name: str, query: str) -> pl.DataFrame:
+    # Keep a dated Parquet copy of each result so container restarts
+    # read it from disk instead of going back to BigQuery. The query digest
+    # keeps a redeploy with different columns from reading an old file.
+    digest = hashlib.md5(query.encode()).hexdigest()[:8]
+    path = CACHE_DIR / f"games_{name}_{date.today().isoformat()}_{digest}.parquet"
+    if path.exists():
+        return pl.read_parquet(path, memory_map=True)
+
+    job = client.query(query)
+    df = pl.from_arrow(job.to_arrow(create_bqstorage_client=True))
+
+    for stale in CACHE_DIR.glob(f"games_{name}_*.parquet"):
+        stale.unlink(missing_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    df.write_parquet(tmp_path, compression="zstd", statistics=True)
+    os.replace(tmp_path, path)
+    return df
+
+def prepare_games(df: pl.DataFrame) -> pl.DataFrame:
+    df = df.cast({col: dtype for col, dtype in NARROW_DTYPES.items() if col in df.columns})
+    # Lowercase titles once per load so searches don't redo it on every rerun
+    return df.with_columns(pl.col("name").str.to_lowercase().alias("name_lc"))
+
+# cache_resource hands back the same frame on every rerun (cache_data would
+# return a fresh copy), so downstream caches can key on its identity.
+@st.cache_resource(show_spinner="Loading and caching popular games...", ttl=86400)
+def load_popular() -> pl.DataFrame:
     query = f"""
-    select id, name, cover_url, rating, rating_count, igdb_url, first_release_date, hypes, dlt_load_timestamp
+    select name, cover_url, igdb_url, rating, rating_count
     from `{PROJECT_ID}.{DATASET}.{TABLE}`
+    where rating_count > 0 and rating is not null
     """
-    return pl.DataFrame(client.query(query).to_dataframe())
+    # Pre-sorting by the default sort flags the column as sorted, so Polars
+    # skips the sort entirely for the default view
+    return prepare_games(run_query("popular", query)).with_columns(
+        pl.col("rating").round(1).cast(pl.Utf8).alias("rating_str")
+    ).sort("rating_count", descending=True)
+
+@st.cache_resource(show_spinner="Loading and caching upcoming releases...", ttl=86400)
+def load_upcoming() -> tuple[pl.DataFrame, int]:
+    query = f"""
+    select name, cover_url, igdb_url, first_release_date, hypes
+    from `{PROJECT_ID}.{DATASET}.{TABLE}`
+    where first_release_date > current_date()
+    """
+    df = prepare_games(run_query("upcoming", query)).with_columns(
+        pl.col("first_release_date").dt.strftime("%b %d, %Y").alias("release_date_str")
+    ).sort("hypes", descending=True)
+    return df, df.get_column("hypes").max()
+
+# Stats come from a one-row aggregate and are formatted once per day
+@st.cache_data(ttl=86400)
+def sidebar_stats() -> tuple[str, int, int]:
+    query = f"""
+    select count(id) as games_count, sum(rating_count) as ratings_count, max(dlt_load_timestamp) as last_update
+    from `{PROJECT_ID}.{DATASET}.{TABLE}`
+    """
+    stats = run_query("stats", query)
+    last_update = stats.item(0, "last_update").strftime("%Y-%m-%d %H:%M UTC")
+    return last_update, stats.item(0, "games_count"), stats.item(0, "ratings_count")
 
-def get_max_hypes(df: pl.DataFrame) -> int:
-    return df.filter(pl.col("first_release_date") > date.today()).get_column("hypes").max()
+# --- FILTER AND PAGINATE ---
+def normalize_search(search: str) -> str:
+    return search.strip().lower()
+
+def title_contains(search: str) -> pl.Expr:
+    # Plain substring match: user input never goes through the regex engine
+    return pl.col("name_lc").str.contains(search, literal=True, strict=False)
+
+def filter_data(df: pl.DataFrame, search: str, rating_range: tuple, min_count: int) -> pl.LazyFrame:
+    predicates = [
+        pl.col("rating").is_between(*rating_range, closed="both"),
+        pl.col("rating_count") >= min_count,
+    ]
+    # Skip the string scan entirely when there is nothing to search for
+    if search:
+        predicates.append(title_contains(search))
+    return df.lazy().filter(pl.all_horizontal(predicates))
+
+def filter_upcoming_data(df: pl.DataFrame, search: str, min_hypes: int, max_hypes: int) -> pl.LazyFrame:
+    predicates = [
+        pl.col("hypes").is_between(min_hypes, max_hypes, closed="both"),
+    ]
+    if search:
+        predicates.append(title_contains(search))
+    return df.lazy().filter(pl.all_horizontal(predicates))
+
+def count_rows(lf: pl.LazyFrame) -> int:
+    # Counting the filter-only plan never runs the sort
+    return lf.select(pl.len()).collect().item()
+
+def paginate(lf: pl.LazyFrame, page: int, sort_by: str, descending: bool,
+             rows_per_page: int = ROWS_PER_PAGE) -> pl.DataFrame:
+    # Sorting and slicing in one lazy query lets Polars run a top-k sort
+    # for the requested page instead of sorting every filtered row
+    start = (page - 1) * rows_per_page
+    return lf.sort(sort_by, descending=descending).slice(start, rows_per_page).collect()
+
+# Only scalars and single pages are cached, so reruns copy 20 rows at most
+@st.cache_data(ttl=3600, hash_funcs={pl.DataFrame: id})
+def count_popular(df: pl.DataFrame, search: str, rating_range: tuple, min_count: int) -> int:
+    return count_rows(filter_data(df, search, rating_range, min_count))
+
+@st.cache_data(ttl=3600, hash_funcs={pl.DataFrame: id})
+def get_popular_page(df: pl.DataFrame, search: str, rating_range: tuple, min_count: int,
+                     page: int, sort_by: str, descending: bool) -> pl.DataFrame:
+    return paginate(filter_data(df, search, rating_range, min_count), page, sort_by, descending)
+
+@st.cache_data(ttl=3600, hash_funcs={pl.DataFrame: id})
+def count_upcoming(df: pl.DataFrame, search: str, min_hypes: int, max_hypes: int) -> int:
+    return count_rows(filter_upcoming_data(df, search, min_hypes, max_hypes))
+
+@st.cache_data(ttl=3600, hash_funcs={pl.DataFrame: id})
+def get_upcoming_page(df: pl.DataFrame, search: str, min_hypes: int, max_hypes: int,
+                      page: int, sort_by: str, descending: bool) -> pl.DataFrame:
+    return paginate(filter_upcoming_data(df, search, min_hypes, max_hypes), page, sort_by, descending)
+
+# --- RENDER ---
+def game_card(url: str, cover_url: str, title: str, meta: str) -> str:
+    return (
+        f'<a href="{url}" target="_blank" style="text-decoration: none;">'
+        f'<div class="game-card">'
+        f'<img src="{cover_url}" width="100%" style="border-radius: 8px; display: block; margin: 0 auto;">'
+        f'<div class="game-title">{title}</div>'
+        f'<div class="game-meta">{meta}</div>'
+        f'</div>'
+        f'</a>'
+    )
 
-def format_last_update(df: pl.DataFrame) -> str:
-    last_update = df.get_column("dlt_load_timestamp").max()
-    return last_update.strftime("%Y-%m-%d %H:%M UTC")
+def render_grid(cards: list[str], col_count: int = 4) -> None:
+    # One markdown call for the whole page instead of one per card and row
+    st.markdown(
+        f'<div style="display: grid; grid-template-columns: repeat({col_count}, 1fr); gap: 12px;">'
+        f'{"".join(cards)}'
+        f'</div>',
+        unsafe_allow_html=True
+    )
 
-def get_games_number(df: pl.DataFrame) -> int:
-    return df.get_column("id").count()
+# --- PAGINATED GRIDS ---
+# Fragments: Previous/Next only rerun the grid, not the sidebar and filters
+@st.fragment
+def render_popular_page(popular_df: pl.DataFrame, search: str, rating_range: tuple, min_count: int,
+                        sort_by: str, descending: bool, total_pages: int) -> None:
+    if "page_num" not in st.session_state:
+        st.session_state.page_num = 1
 
-def get_ratings_count(df: pl.DataFrame) -> int:
-    return df.get_column("rating_count").sum()
+    # Pagination controls
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("⬅️ Previous", key="prev_popular", use_container_width=True) and st.session_state.page_num > 1:
+            st.session_state.page_num -= 1
+    with col3:
+        if st.button("Next ➡️", key="next_popular", use_container_width=True) and st.session_state.page_num < total_pages:
+            st.session_state.page_num += 1
+    with col2:
+        st.markdown(f"<div style='text-align:center;'>Page {st.session_state.page_num} of {total_pages}</div>", unsafe_allow_html=True)
 
-# --- FILTER AND PAGINATE ---
-def filter_data(df: pl.DataFrame, search: str, rating_range: tuple, min_count: int,
-                sort_by: str, order: str) -> pl.DataFrame:
-    filtered = df.filter(
-        (pl.col("name").str.to_lowercase().str.contains(search.lower())) &
-        (pl.col("rating") >= rating_range[0]) &
-        (pl.col("rating") <= rating_range[1]) &
-        (pl.col("rating_count") >= min_count)
+    page_df = get_popular_page(
+        popular_df,
+        search,
+        rating_range,
+        min_count,
+        st.session_state.page_num,
+        sort_by,
+        descending
     )
-    if order == "ASC":
-        filtered = filtered.sort(sort_by)
-    else:
-        filtered = filtered.sort(sort_by, descending=True)
-    return filtered
-
-def filter_upcoming_data(df: pl.DataFrame, search: str, min_hypes: int, max_hypes: int, 
-                        sort_by: str = "Release Date", order: str = "Ascending") -> pl.DataFrame:
-    filtered = df.filter(
-        (pl.col("first_release_date") > date.today()) &
-        (pl.col("name").str.to_lowercase().str.contains(search.lower())) &
-        (pl.col("hypes") >= min_hypes) &
-        (pl.col("hypes") <= max_hypes)
+
+    page_rows = page_df.rows()
+    render_grid([
+        game_card(game[2], game[1], game[0], f"⭐ {game[6]} &nbsp;&nbsp; 💬 {game[4]}")
+        for game in page_rows
+    ])
+
+@st.fragment
+def render_upcoming_page(upcoming_df: pl.DataFrame, search: str, min_hypes: int, max_hypes: int,
+                         sort_by: str, descending: bool, total_pages: int) -> None:
+    # Pagination state
+    if "upcoming_page_num" not in st.session_state:
+        st.session_state.upcoming_page_num = 1
+
+    # Pagination controls
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("⬅️ Previous", key="prev_upcoming", use_container_width=True) and st.session_state.upcoming_page_num > 1:
+            st.session_state.upcoming_page_num -= 1
+    with col3:
+        if st.button("Next ➡️", key="next_upcoming", use_container_width=True) and st.session_state.upcoming_page_num < total_pages:
+            st.session_state.upcoming_page_num += 1
+    with col2:
+        st.markdown(f"<div style='text-align:center;'>Page {st.session_state.upcoming_page_num} of {total_pages}</div>", unsafe_allow_html=True)
+
+    # Get paginated data
+    page_df = get_upcoming_page(
+        upcoming_df,
+        search,
+        min_hypes,
+        max_hypes,
+        st.session_state.upcoming_page_num,
+        sort_by,
+        descending
     )
-    
-    # Sort based on selected option with order
-    descending = order == "Descending"
-    if sort_by == "Release Date":
-        return filtered.sort("first_release_date", descending=descending)
-    else:  # sort by hypes
-        return filtered.sort("hypes", descending=descending)
-
-def paginate(df: pl.DataFrame, page: int, rows_per_page: int = ROWS_PER_PAGE) -> pl.DataFrame:
-    start = (page - 1) * rows_per_page
-    return df.slice(start, rows_per_page)
+
+    # Display grid
+    page_rows = page_df.rows()
+    render_grid([
+        game_card(game[2], game[1], game[0], f"🚀 {game[6]} &nbsp;&nbsp; 🔥 {game[4]}")
+        for game in page_rows
+    ])
 
 # --- STYLE ---
-st.markdown("""
+CSS_BLOCK = """
     <style>
     .game-card {
         border-radius: 12px;
@@ -105,14 +265,12 @@ st.markdown("""
         color: #2b2b2b;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
+# Style-only st.html goes to the page's event container without adding layout
+st.html(CSS_BLOCK)
 
 # --- LOAD DATA ---
-full_df = load_full_dataset()
-
-last_update = format_last_update(full_df)
-total_games_count = get_games_number(full_df)
-ratings_count = get_ratings_count(full_df)
+last_update, total_games_count, ratings_count = sidebar_stats()
 
 # --- SIDEBAR HEADER ---
 st.logo("igdb_logo.svg", size="large", link=None)
@@ -146,7 +304,9 @@ tab_choice = st.sidebar.radio("Select View", ["🚀 Upcoming Releases", "🔥 Po
 
 if tab_choice == "🔥 Popular Games":
     # --- SIDEBAR FILTERS FOR POPULAR ---
-    search = st.sidebar.text_input("🔍 Search Title", key="search_popular")
+    # text_input only reruns on Enter or blur, so typing itself never filters;
+    # normalizing lets "Zelda " and "zelda" share one cached result
+    search = normalize_search(st.sidebar.text_input("🔍 Search Title", key="search_popular"))
     rating_range = st.sidebar.slider(
         "⭐ Rating Range", 
         0, 
@@ -161,8 +321,8 @@ if tab_choice == "🔥 Popular Games":
 
 elif tab_choice == "🚀 Upcoming Releases":
     # --- SIDEBAR FILTERS FOR UPCOMING ---
-    search_upcoming = st.sidebar.text_input("🔍 Search Title", key="search_upcoming")
-    max_hypes = get_max_hypes(full_df)
+    search_upcoming = normalize_search(st.sidebar.text_input("🔍 Search Title", key="search_upcoming"))
+    upcoming_df, max_hypes = load_upcoming()
     hypes_range = st.sidebar.slider(
         "🔥 Hypes Range", 
         0, 
@@ -181,107 +341,31 @@ elif tab_choice == "🚀 Upcoming Releases":
 
 # --- POPULAR GAMES VIEW ---
 if tab_choice == "🔥 Popular Games":
-    filtered_df = filter_data(full_df, search, rating_range, min_count, sort_by, order)
-    total_games = filtered_df.shape[0]
-    total_pages = max(1, math.ceil(total_games / ROWS_PER_PAGE))
+    popular_df = load_popular()
+    total_games = count_popular(popular_df, search, rating_range, min_count)
+    total_pages = max(1, -(-total_games // ROWS_PER_PAGE))
 
     st.markdown("### 🔥 Popular Games")
 
     st.markdown("Top IGDB games by users rating and popularity.")
 
-    if "page_num" not in st.session_state:
-        st.session_state.page_num = 1
-
-    # Pagination controls
-    col1, col2, col3 = st.columns([1, 2, 1])
-    with col1:
-        if st.button("⬅️ Previous", key="prev_popular", use_container_width=True) and st.session_state.page_num > 1:
-            st.session_state.page_num -= 1
-    with col3:
-        if st.button("Next ➡️", key="next_popular", use_container_width=True) and st.session_state.page_num < total_pages:
-            st.session_state.page_num += 1
-    with col2:
-        st.markdown(f"<div style='text-align:center;'>Page {st.session_state.page_num} of {total_pages}</div>", unsafe_allow_html=True)
-
-    page_df = paginate(filtered_df, st.session_state.page_num)
-
-    col_count = 4
-    rows = page_df.shape[0] // col_count + int(page_df.shape[0] % col_count != 0)
-
-    for i in range(rows):
-        st.markdown('<div class="game-row">', unsafe_allow_html=True)
-        cols = st.columns(col_count)
-        for j in range(col_count):
-            idx = i * col_count + j
-            if idx < page_df.shape[0]:
-                game = page_df.row(idx)
-                with cols[j]:
-                    st.markdown(f"""
-                        <a href="{game[5]}" target="_blank" style="text-decoration: none;">
-                            <div class="game-card">
-                                <img src="{game[2]}" width="100%" style="border-radius: 8px; display: block; margin: 0 auto;">
-                                <div class="game-title">{game[1]}</div>
-                                <div class="game-meta">⭐ {game[3]:.1f} &nbsp;&nbsp; 💬 {game[4]}</div>
-                            </div>
-                        </a>
-                    """, unsafe_allow_html=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+    render_popular_page(popular_df, search, rating_range, min_count, sort_by, order == "DESC", total_pages)
 
 # --- UPCOMING RELEASES VIEW ---
 elif tab_choice == "🚀 Upcoming Releases":
-    filtered_df = filter_upcoming_data(
-        full_df, 
-        search_upcoming, 
-        hypes_range[0], 
-        hypes_range[1],
-        sort_by_upcoming,
-        order_upcoming
-    )
-    total_games = filtered_df.shape[0]
-    total_pages = max(1, math.ceil(total_games / ROWS_PER_PAGE))
+    total_games = count_upcoming(upcoming_df, search_upcoming, hypes_range[0], hypes_range[1])
+    total_pages = max(1, -(-total_games // ROWS_PER_PAGE))
 
     st.markdown("### 🚀 Upcoming Releases")
 
     st.markdown("Most anticipated games based on \"Hypes\" — the number of follows a game receives before release.")
 
-    # Pagination state
-    if "upcoming_page_num" not in st.session_state:
-        st.session_state.upcoming_page_num = 1
-
-    # Pagination controls
-    col1, col2, col3 = st.columns([1, 2, 1])
-    with col1:
-        if st.button("⬅️ Previous", key="prev_upcoming", use_container_width=True) and st.session_state.upcoming_page_num > 1:
-            st.session_state.upcoming_page_num -= 1
-    with col3:
-        if st.button("Next ➡️", key="next_upcoming", use_container_width=True) and st.session_state.upcoming_page_num < total_pages:
-            st.session_state.upcoming_page_num += 1
-    with col2:
-        st.markdown(f"<div style='text-align:center;'>Page {st.session_state.upcoming_page_num} of {total_pages}</div>", unsafe_allow_html=True)
-
-    # Get paginated data
-    page_df = paginate(filtered_df, st.session_state.upcoming_page_num)
-
-    # Display grid
-    col_count = 4
-    rows = page_df.shape[0] // col_count + int(page_df.shape[0] % col_count != 0)
-
-    for i in range(rows):
-        st.markdown('<div class="game-row">', unsafe_allow_html=True)
-        cols = st.columns(col_count)
-        for j in range(col_count):
-            idx = i * col_count + j
-            if idx < page_df.shape[0]:
-                game = page_df.row(idx)
-                release_date = game[6].strftime("%b %d, %Y")
-                with cols[j]:
-                    st.markdown(f"""
-                        <a href="{game[5]}" target="_blank" style="text-decoration: none;">
-                            <div class="game-card">
-                                <img src="{game[2]}" width="100%" style="border-radius: 8px; display: block; margin: 0 auto;">
-                                <div class="game-title">{game[1]}</div>
-                                <div class="game-meta">🚀 {release_date} &nbsp;&nbsp; 🔥 {game[7]}</div>
-                            </div>
-                        </a>
-                    """, unsafe_allow_html=True)
-        st.markdown('</div>', unsafe_allow_html=True)
\ No newline at end of file
+    render_upcoming_page(
+        upcoming_df,
+        search_upcoming,
+        hypes_range[0],
+        hypes_range[1],
+        UPCOMING_SORT_COLUMNS[sort_by_upcoming],
+        order_upcoming == "Descending",
+        total_pages
+    )